@@ -67,6 +67,9 @@ class Config(BaseConfig):
         self.wd_delay = 30
         self.wd_max_wait = None
         self.wd_response = None
+        self.dedup_max_lines = 0
+        self.dedup_flush_delay = 60
+        self.dedup_pattern = None
 
     def load_cfg_param(self, prop_name, var_name=None, section=GLOBAL_SECTION):
         if not var_name:
@@ -107,6 +110,9 @@ class Config(BaseConfig):
         self.load_cfg_param("initial_cmd", section=section)
         self.load_cfg_param("initial_cmd_error_phrase", section=section)
         self.load_cfg_param_int("session_timer", section=section)
+        self.load_cfg_param_int("dedup_max_lines", section=section)
+        self.load_cfg_param_int("dedup_flush_delay", section=section)
+        self.load_cfg_param("dedup_pattern", section=section)
 
 
     def load_from_file(self, file_name):
@@ -169,7 +175,16 @@ class LineListener:
     this is abstract class
     """
 
-    def on_line_received(self, line, telnet_base, source=LineSource.REMOTE, level=logging.INFO):
+    def on_line_received(self, line, telnet_base, source=LineSource.REMOTE, level=logging.INFO, created=None):
+        """
+        :param created: time.time() the line was received at, None if it is passed on as soon as received
+        """
+        pass
+
+    def flush(self, telnet_base, force=False):
+        """
+        called periodically from the main loop (force=False) and before quitting (force=True)
+        """
         pass
 
 
@@ -298,6 +313,10 @@ class TelnetBase:
         for listener in self.listeners.values():
             listener.on_line_received(line, self, source, level)
 
+    def flush_listeners(self, force=False):
+        for listener in list(self.listeners.values()):
+            listener.flush(self, force)
+
     def process_filters(self, line, source=LineSource.REMOTE):
         for f in self.filters.values():
             # reset reconnect timer by every line received
@@ -365,25 +384,169 @@ class TelnetBase:
 
 class LoggerListener(LineListener):
     def __init__(self, filename, max_bytes, backup_count):
+        self.level = logging.INFO
         self.logger = logging.getLogger("telnet")
         rfh = RotatingFileHandler(filename=filename, maxBytes=max_bytes, backupCount=backup_count)
-        rfh.setLevel(logging.INFO)
+        rfh.setLevel(self.level)
         # rfh.setFormatter(logging.Formatter(fmt="%(asctime)s %(message)s"))
         formatter = logging.Formatter('[%(asctime)s] %(message)s', datefmt='%m-%d %H:%M:%S')
         rfh.setFormatter(formatter)
         self.logger.addHandler(rfh)
-        self.logger.setLevel(logging.INFO)
+        self.logger.setLevel(self.level)
+
+    def on_line_received(self, line, telnet_base, source=LineSource.REMOTE, level=logging.INFO, created=None):
+        if created is None:
+            self.logger.log(level, "%s", line)
+        elif self.logger.isEnabledFor(level):
+            # line written later than received, keep the receive time in the log
+            record = self.logger.makeRecord(self.logger.name, level, "(unknown file)", 0, "%s", (line,), None)
+            record.created = created
+            record.msecs = (created - int(created)) * 1000
+            self.logger.handle(record)
+
+
+class DedupListener(LineListener):
+    """
+    Collapses repeated lines before passing them on to another listener.
+
+    A run of the last 1..max_lines lines repeating itself (e.g. "watchdog triggered", "AT", "OK") is written
+    twice and then replaced by a single "previous N line(s) repeated M more time(s) between T1 and T2" record.
+    With max_lines=1 a repeated line is collapsed from its first repetition. Lines below min_level are not
+    written by the wrapped listener anyway, so they are passed through and don't take part in the comparison.
+    Lines are compared after replacing every match of pattern (if given) with "*", so pattern="\\d+" makes
+    lines differing only by numbers equivalent; the record then ends with the last collapsed line(s).
+    The record is written when the run is broken, when the run has been collapsing for flush_delay seconds,
+    or on flush(force=True). Lines of an incomplete repetition are held back for at most flush_delay seconds
+    and passed on with the time they were received.
+    """
+    TIME_FMT = "%m-%d %H:%M:%S"
+
+    def __init__(self, listener, max_lines, flush_delay, pattern=None, min_level=logging.INFO):
+        self.listener = listener
+        self.max_lines = max_lines
+        self.flush_delay = flush_delay
+        self.patt = re.compile(pattern) if pattern else None
+        self.min_level = min_level
+        # (key, line, source, level) of the recently written lines, bounded to two repetitions of max_lines
+        self.history = []
+        # the repeating group of lines, None if no run is being collapsed
+        self.group = None
+        # position in the group of the next expected line
+        self.group_pos = 0
+        # ((key, line, source, level), receive time) of the held back lines of the current repetition
+        self.pending = []
+        # True if the held back lines of the current repetition were written on flush_delay timeout
+        self.released = False
+        self.repeat_count = 0
+        self.first_repeat_time = None
+        self.last_repeat_time = None
+        self.last_repeat_lines = None
+
+    def make_key(self, line, source, level):
+        if self.patt:
+            line = self.patt.sub("*", line)
+        return source, level, line
+
+    def on_line_received(self, line, telnet_base, source=LineSource.REMOTE, level=logging.INFO, created=None):
+        if level < self.min_level:
+            self.listener.on_line_received(line, telnet_base, source, level, created=created)
+            return
+        if created is None:
+            created = time.time()
+        key = self.make_key(line, source, level)
+        if not self.group and self.max_lines == 1 and self.history and self.history[-1][0] == key:
+            # a single repeated line, start collapsing from its first repetition
+            self.group = self.history[-1:]
+            self.group_pos = 0
+        if self.group:
+            if self.group[self.group_pos][0] == key:
+                self.match_line(line, telnet_base, source, level, key, created)
+                return
+            self.end_run(telnet_base)
+        self.write_line(line, telnet_base, source, level, key, created)
+        self.detect_run()
+
+    def match_line(self, line, telnet_base, source, level, key, created):
+        if self.released:
+            self.write_line(line, telnet_base, source, level, key, created)
+        else:
+            self.pending.append(((key, line, source, level), created))
+        self.group_pos += 1
+        if self.group_pos == len(self.group):
+            if not self.released:
+                self.repeat_count += 1
+                if not self.first_repeat_time:
+                    self.first_repeat_time = self.pending[0][1]
+                self.last_repeat_time = created
+                self.last_repeat_lines = [entry[1] for entry, _ in self.pending]
+            self.group_pos = 0
+            self.pending = []
+            self.released = False
+
+    def write_line(self, line, telnet_base, source, level, key, created=None):
+        self.listener.on_line_received(line, telnet_base, source, level, created=created)
+        self.history.append((key, line, source, level))
+        del self.history[:-2 * self.max_lines]
+
+    def detect_run(self):
+        # prefer the longest group, so a group containing a repeated line (A A B) is still found
+        keys = [entry[0] for entry in self.history]
+        for size in range(min(self.max_lines, len(keys) // 2), 0, -1):
+            if keys[-size:] == keys[-2 * size:-size]:
+                self.group = self.history[-size:]
+                self.group_pos = 0
+                return
 
-    def on_line_received(self, line, telnet_base, source=LineSource.REMOTE, level=logging.INFO):
-        self.logger.log(level, "%s", line)
+    def write_summary(self, telnet_base):
+        if self.repeat_count:
+            first = time.strftime(DedupListener.TIME_FMT, time.localtime(self.first_repeat_time))
+            last = time.strftime(DedupListener.TIME_FMT, time.localtime(self.last_repeat_time))
+            source = self.group[-1][2]
+            level = max(max(entry[3] for entry in self.group), logging.INFO)
+            summary = f"previous {len(self.group)} line(s) repeated {self.repeat_count} more time(s) " \
+                      f"between {first} and {last}"
+            if self.patt:
+                # the collapsed lines may differ from the written ones, keep the last of them
+                summary += ", last: " + " | ".join(self.last_repeat_lines)
+            self.listener.on_line_received(summary, telnet_base, source, level, created=self.last_repeat_time)
+        self.repeat_count = 0
+        self.first_repeat_time = None
+        self.last_repeat_time = None
+        self.last_repeat_lines = None
+
+    def release_pending(self, telnet_base):
+        self.write_summary(telnet_base)
+        for (key, line, source, level), received in self.pending:
+            self.write_line(line, telnet_base, source, level, key, received)
+        self.pending = []
+
+    def end_run(self, telnet_base):
+        self.release_pending(telnet_base)
+        self.group = None
+        self.group_pos = 0
+        self.released = False
+
+    def flush(self, telnet_base, force=False):
+        if self.group:
+            now = time.time()
+            if force:
+                self.end_run(telnet_base)
+            elif self.pending and now - self.pending[0][1] >= self.flush_delay:
+                # write the incomplete repetition but keep collapsing the run once it is complete
+                self.release_pending(telnet_base)
+                self.released = True
+            elif self.first_repeat_time and now - self.first_repeat_time >= self.flush_delay:
+                # keep collapsing the run, just report what has been collapsed so far
+                self.write_summary(telnet_base)
+        self.listener.flush(telnet_base, force)
 
 
 class LogConsoleListener(LineListener):
     def __init__(self):
         pass
 
-    def on_line_received(self, line, telnet_base, source=LineSource.REMOTE, level=logging.INFO):
-        time_str = time.strftime("%c")
+    def on_line_received(self, line, telnet_base, source=LineSource.REMOTE, level=logging.INFO, created=None):
+        time_str = time.strftime("%c", time.localtime(created))
         if level >= logging.INFO:
             print("{}: {}".format(time_str, line))
 
@@ -392,7 +555,7 @@ class InitialCommandErrorPhraseListener(LineListener):
     def __init__(self, initial_cmd_error_phrase):
         self.patt = re.compile(initial_cmd_error_phrase)
 
-    def on_line_received(self, line, telnet_base, source=LineSource.REMOTE, level=logging.INFO):
+    def on_line_received(self, line, telnet_base, source=LineSource.REMOTE, level=logging.INFO, created=None):
         if source == LineSource.REMOTE and self.patt.match(line):
             telnet_base.error("initial command failed. Will be resent")
             telnet_base.initial_cmd()
@@ -402,7 +565,7 @@ class ConsoleListener(LineListener):
     def __init__(self):
         pass
 
-    def on_line_received(self, line, telnet_base, source=LineSource.REMOTE, level=logging.INFO):
+    def on_line_received(self, line, telnet_base, source=LineSource.REMOTE, level=logging.INFO, created=None):
         print("{}".format(line))
 
 
@@ -410,7 +573,7 @@ class SimpleFileListener(LineListener):
     def __init__(self):
         pass
 
-    def on_line_received(self, line, telnet_base, source=LineSource.REMOTE, level=logging.INFO):
+    def on_line_received(self, line, telnet_base, source=LineSource.REMOTE, level=logging.INFO, created=None):
         with open(self.log_path, mode="a") as f:
             f.write(line)
 
@@ -475,6 +638,12 @@ def get_cmd_params():
                   help="filename of a log file")
     op.add_option("--file-dir", dest="file_dir",
                   help="directory of a log file")
+    op.add_option("--dedup-max-lines", dest="dedup_max_lines", type="int",
+                  help="collapse repeated groups of up to this many lines in the log file (defaults to 0, disabled)")
+    op.add_option("--dedup-flush-delay", dest="dedup_flush_delay", type="int",
+                  help="max seconds to collapse repeated lines before writing the repeat record (defaults to 60)")
+    op.add_option("--dedup-pattern", dest="dedup_pattern",
+                  help="regex; lines differing only in matches of it are treated as repeated")
     op.add_option("-c", "--cfg", dest="cfg", help="configuration file (defaults to ~/telnet_logger.ini", default=None)
     opts, args = op.parse_args()
     return opts, args
@@ -492,7 +661,12 @@ class TelnetLogger(TelnetBase):
             # log_fn = "./log/" + conf.host + "-" + timestampStr + "_" + self.log_path
             log_fn = conf.file_dir + "/" + conf.host + "-" + timestampStr + "_" + self.log_path
             self.logger_listener = LoggerListener(log_fn, conf.max_log_size, conf.max_logs)
-            self.add_listener(self.logger_listener)
+            if conf.dedup_max_lines:
+                self.add_listener(DedupListener(self.logger_listener, max_lines=conf.dedup_max_lines,
+                                                flush_delay=conf.dedup_flush_delay, pattern=conf.dedup_pattern,
+                                                min_level=self.logger_listener.level))
+            else:
+                self.add_listener(self.logger_listener)
             self.has_output = True
         # if sys.stdin.isatty():
         self.console_listener = LogConsoleListener()
@@ -520,6 +694,11 @@ def sig_usr2(signum, frame):
         Global.telnet.cmd_usr2()
 
 
+def sig_term(signum, frame):
+    # raise SystemExit so pending log lines are flushed in main()
+    sys.exit(128 + signum)
+
+
 password_db = {}
 with open("password_db.txt") as cmudict:
     for cur_ln in cmudict:
@@ -558,50 +737,58 @@ def main():
     Global.telnet = telnet
     signal.signal(signal.SIGUSR1, sig_usr1)
     signal.signal(signal.SIGUSR2, sig_usr2)
+    signal.signal(signal.SIGTERM, sig_term)
     local_fd = None
     if sys.stdin.isatty() or True:
         local_fd = sys.stdin
 
     session_expiration_tm = time.time() + c.session_timer
-    while True:
-        if c.session_timer and time.time() > session_expiration_tm:
-            telnet.info(f'telnet session timeout, quit!!\n\n')
-            return
-
-        try:
-            telnet.connect()
-            if telnet.wd:
-                telnet.wd.reset()
-            wd_time = time.time()
-            while True:
-                if c.session_timer and time.time() > session_expiration_tm:
-                    telnet.info(f'telnet session timeout, quit!!\n\n')
-                    return
-
-                telnet.send_pending_cmd()
-                telnet.process_remote_data(local_fd=local_fd, timeout=4)
-                ctime = time.time()
-                # send keep alive command every c.wd_delay
-                if c.wd_cmd and c.wd_delay and ctime > wd_time + c.wd_delay:
-                    telnet.info(f"watchdog triggered")
-                    telnet.watchdog_cmd()
-                    wd_time = time.time()
-                # reset the connection if re-connect timer(wd_timeout or wd_max_wait in the configuration) is up
-                if telnet.wd and telnet.wd.is_expired():
-                    telnet.error("==========================================================")
-                    telnet.error("remote host is not responding. Reconnecting in progress...")
-                    telnet.error("==========================================================")
-                    telnet.disconnect()
-                    break
+    try:
+        while True:
+            # reconnect attempts may keep failing, write out collapsed lines meanwhile
+            telnet.flush_listeners()
+            if c.session_timer and time.time() > session_expiration_tm:
+                telnet.info(f'telnet session timeout, quit!!\n\n')
+                return
 
-        except socket.error as e:
-            telnet.error(f'socket error during connection: {e.__class__}\n{e}. \nRetrying after {c.reconnect_delay} seconds...')
-            # raise
-            time.sleep(c.reconnect_delay)
-        except Exception as e:
-            telnet.error(f'error during connection: {e.__class__}\n{e}. \nRetrying after {c.reconnect_delay} seconds...')
-            # raise
-            time.sleep(c.reconnect_delay)
+            try:
+                telnet.connect()
+                if telnet.wd:
+                    telnet.wd.reset()
+                wd_time = time.time()
+                while True:
+                    if c.session_timer and time.time() > session_expiration_tm:
+                        telnet.info(f'telnet session timeout, quit!!\n\n')
+                        return
+
+                    telnet.send_pending_cmd()
+                    telnet.process_remote_data(local_fd=local_fd, timeout=4)
+                    telnet.flush_listeners()
+                    ctime = time.time()
+                    # send keep alive command every c.wd_delay
+                    if c.wd_cmd and c.wd_delay and ctime > wd_time + c.wd_delay:
+                        telnet.info(f"watchdog triggered")
+                        telnet.watchdog_cmd()
+                        wd_time = time.time()
+                    # reset the connection if re-connect timer(wd_timeout or wd_max_wait in the configuration) is up
+                    if telnet.wd and telnet.wd.is_expired():
+                        telnet.error("==========================================================")
+                        telnet.error("remote host is not responding. Reconnecting in progress...")
+                        telnet.error("==========================================================")
+                        telnet.disconnect()
+                        break
+
+            except socket.error as e:
+                telnet.error(f'socket error during connection: {e.__class__}\n{e}. \nRetrying after {c.reconnect_delay} seconds...')
+                # raise
+                time.sleep(c.reconnect_delay)
+            except Exception as e:
+                telnet.error(f'error during connection: {e.__class__}\n{e}. \nRetrying after {c.reconnect_delay} seconds...')
+                # raise
+                time.sleep(c.reconnect_delay)
+    finally:
+        # write out collapsed/held back lines also on Ctrl-C or SIGTERM
+        telnet.flush_listeners(force=True)
 
 
 if __name__ == '__main__':